@@ -1,11 +1,24 @@
-from atproto import Client
+from atproto import Client, models
+from atproto.exceptions import BadRequestError, RequestException
+from cryptography.fernet import Fernet  # dependency van atproto
+import base64
+import hashlib
+import heapq
 import os
+import random
 import re
 import time
 import json
 import sys
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timedelta, timezone
-from typing import Optional, Dict, List, Set, Tuple
+from operator import attrgetter
+from typing import Optional, Dict, Iterator, List, Set, Tuple
+
+try:
+    import orjson  # optioneel: snellere (de)serialisatie van state.json
+except ImportError:
+    orjson = None
 
 # Github Actions: print direct
 try:
@@ -66,7 +79,13 @@ PROMO_LIST_KEY = "lijst 1"
 HOURS_BACK = int(os.getenv("HOURS_BACK", "3"))
 MAX_PER_RUN = int(os.getenv("MAX_PER_RUN", "50"))
 MAX_PER_USER = int(os.getenv("MAX_PER_USER", "3"))
-SLEEP_SECONDS = float(os.getenv("SLEEP_SECONDS", "2"))
+SLEEP_SECONDS = float(os.getenv("SLEEP_SECONDS", "2"))  # fallback als de PDS geen ratelimit-headers stuurt
+RETRY_BACKOFF_SECONDS = [0.5, 1, 2, 4, 8]  # bij HTTP 429
+RATE_LIMIT_THRESHOLD = float(os.getenv("RATE_LIMIT_THRESHOLD", "0.1"))  # pas afremmen onder 10% budget
+MAX_WAIT_SECONDS = float(os.getenv("MAX_WAIT_SECONDS", "180"))  # langer wachten -> stoppen en state bewaren
+APPLY_WRITES_MAX_OPS = 200  # max writes per applyWrites-call (PDS-limiet)
+# posts per applyWrites (2 writes per post), nooit boven de PDS-limiet
+WRITE_BATCH_SIZE = max(1, min(int(os.getenv("WRITE_BATCH_SIZE", "25")), APPLY_WRITES_MAX_OPS // 2))
 
 STATE_FILE = os.getenv("STATE_FILE", "state.json")
 
@@ -74,16 +93,42 @@ LIST_MEMBER_LIMIT = int(os.getenv("LIST_MEMBER_LIMIT", "1500"))
 AUTHOR_POSTS_PER_MEMBER = int(os.getenv("AUTHOR_POSTS_PER_MEMBER", "30"))  # aanrader voor "nieuwste mediapost"
 FEED_MAX_ITEMS = int(os.getenv("FEED_MAX_ITEMS", "500"))
 HASHTAG_MAX_ITEMS = int(os.getenv("HASHTAG_MAX_ITEMS", "100"))
+FETCH_CONCURRENCY = int(os.getenv("FETCH_CONCURRENCY", "8"))  # max parallelle reads (feeds, hashtag, author feeds)
+DID_CACHE_HOURS = float(os.getenv("DID_CACHE_HOURS", "24"))  # handle -> DID cache (state.json)
+EXCLUDE_CACHE_HOURS = float(os.getenv("EXCLUDE_CACHE_HOURS", "1"))  # exclude-leden cache (state.json)
 
 # Secrets (GitHub)
 ENV_USERNAME = "BSKY_USERNAME"
 ENV_PASSWORD = "BSKY_PASSWORD"
+ENV_SESSION_KEY = "BSKY_SESSION_KEY"  # optioneel: lange random string; zonder -> geen session in state.json
 
 # ============================================================
 # REGEX
 # ============================================================
-FEED_URL_RE = re.compile(r"^https?://(www\.)?bsky\.app/profile/([^/]+)/feed/([^/?#]+)", re.I)
-LIST_URL_RE = re.compile(r"^https?://(www\.)?bsky\.app/profile/([^/]+)/lists/([^/?#]+)", re.I)
+BSKY_URL_RE = re.compile(
+    r"^https?://(www\.)?bsky\.app/profile/(?P<actor>[^/]+)/(?P<kind>feed|lists)/(?P<rkey>[^/?#]+)", re.I
+)
+
+# ============================================================
+# EMBED TYPES ($type; record + view varianten)
+# ============================================================
+MEDIA_EMBED_TYPES = frozenset({
+    "app.bsky.embed.images",
+    "app.bsky.embed.images#view",
+    "app.bsky.embed.video",
+    "app.bsky.embed.video#view",
+})
+RECORD_WITH_MEDIA_EMBED_TYPES = frozenset({
+    "app.bsky.embed.recordWithMedia",
+    "app.bsky.embed.recordWithMedia#view",
+})
+QUOTE_EMBED_TYPES = frozenset({
+    "app.bsky.embed.record",
+    "app.bsky.embed.record#view",
+}) | RECORD_WITH_MEDIA_EMBED_TYPES
+
+# velden die de candidate-filter per post nodig heeft (één C-call i.p.v. losse attribute-access)
+POST_FIELDS = attrgetter("record", "uri", "cid", "author.handle", "author.did")
 
 
 def log(msg: str):
@@ -94,8 +139,21 @@ def utcnow() -> datetime:
     return datetime.now(timezone.utc)
 
 
+def is_fresh(ts: Optional[str], hours: float) -> bool:
+    """
+    True als ts (iso, zoals in state.json) minder dan `hours` oud is.
+    """
+    if not ts:
+        return False
+    try:
+        return utcnow() - datetime.fromisoformat(ts.replace("Z", "+00:00")) < timedelta(hours=hours)
+    except Exception:
+        return False
+
+
 def parse_time(post) -> Optional[datetime]:
-    indexed = getattr(post, "indexedAt", None) or getattr(post, "indexed_at", None)
+    # atproto models: snake_case eerst (de gangbare route)
+    indexed = getattr(post, "indexed_at", None) or getattr(post, "indexedAt", None)
     if indexed:
         try:
             return datetime.fromisoformat(indexed.replace("Z", "+00:00"))
@@ -104,7 +162,7 @@ def parse_time(post) -> Optional[datetime]:
 
     record = getattr(post, "record", None)
     if record:
-        created = getattr(record, "createdAt", None) or getattr(record, "created_at", None)
+        created = getattr(record, "created_at", None) or getattr(record, "createdAt", None)
         if created:
             try:
                 return datetime.fromisoformat(created.replace("Z", "+00:00"))
@@ -117,6 +175,9 @@ def is_quote_post(record) -> bool:
     embed = getattr(record, "embed", None)
     if not embed:
         return False
+    etype = getattr(embed, "py_type", None)
+    if etype:
+        return etype in QUOTE_EMBED_TYPES
     return bool(getattr(embed, "record", None) or getattr(embed, "recordWithMedia", None))
 
 
@@ -129,6 +190,15 @@ def has_media(record) -> bool:
     if not embed:
         return False
 
+    # snelle route: dispatch op $type (py_type in de atproto models)
+    etype = getattr(embed, "py_type", None)
+    if etype:
+        if etype in MEDIA_EMBED_TYPES:
+            return True
+        if etype in RECORD_WITH_MEDIA_EMBED_TYPES:
+            return getattr(getattr(embed, "media", None), "py_type", None) in MEDIA_EMBED_TYPES
+        return False
+
     if getattr(embed, "images", None):
         return True
     if getattr(embed, "video", None):
@@ -148,62 +218,191 @@ def has_media(record) -> bool:
     return False
 
 
+# handle -> {"did": ..., "ts": iso}; gevuld uit/bewaard in state["did_cache"]
+DID_CACHE: Dict[str, Dict[str, str]] = {}
+
+
 def resolve_handle_to_did(client: Client, actor: str) -> Optional[str]:
     if actor.startswith("did:"):
         return actor
+
+    key = actor.lower()
+    hit = DID_CACHE.get(key)
+    if hit and is_fresh(hit.get("ts"), DID_CACHE_HOURS):
+        return hit["did"]
+
     try:
         out = client.com.atproto.identity.resolve_handle({"handle": actor})
-        return getattr(out, "did", None)
+        did = getattr(out, "did", None)
     except Exception:
-        return None
+        did = None
+
+    if did:
+        DID_CACHE[key] = {"did": did, "ts": utcnow().strftime("%Y-%m-%dT%H:%M:%SZ")}
+    else:
+        # handle mislukt (gewijzigd/verwijderd) -> cache-entry weg
+        DID_CACHE.pop(key, None)
+    return did
 
 
-def normalize_feed_uri(client: Client, s: str) -> Optional[str]:
+def normalize_bsky_uri(client: Client, s: str, kind: str, collection: str) -> Optional[str]:
+    """
+    bsky.app-link (kind: "feed" / "lists") of at-uri -> at://{did}/{collection}/{rkey}.
+    """
     if not s:
         return None
     s = s.strip()
-    if s.startswith("at://") and "/app.bsky.feed.generator/" in s:
+    if s.startswith("at://") and f"/{collection}/" in s:
         return s
-    m = FEED_URL_RE.match(s)
-    if not m:
+    m = BSKY_URL_RE.match(s)
+    if not m or m.group("kind").lower() != kind:
         return None
-    actor = m.group(2)
-    rkey = m.group(3)
-    did = resolve_handle_to_did(client, actor)
+    actor = m.group("actor")
+    did = actor if actor.startswith("did:") else resolve_handle_to_did(client, actor)
     if not did:
         return None
-    return f"at://{did}/app.bsky.feed.generator/{rkey}"
+    return f"at://{did}/{collection}/{m.group('rkey')}"
+
+
+def normalize_feed_uri(client: Client, s: str) -> Optional[str]:
+    return normalize_bsky_uri(client, s, "feed", "app.bsky.feed.generator")
 
 
 def normalize_list_uri(client: Client, s: str) -> Optional[str]:
-    if not s:
-        return None
-    s = s.strip()
-    if s.startswith("at://") and "/app.bsky.graph.list/" in s:
-        return s
-    m = LIST_URL_RE.match(s)
-    if not m:
-        return None
-    actor = m.group(2)
-    rkey = m.group(3)
-    did = resolve_handle_to_did(client, actor)
-    if not did:
-        return None
-    return f"at://{did}/app.bsky.graph.list/{rkey}"
+    return normalize_bsky_uri(client, s, "lists", "app.bsky.graph.list")
 
 
 def load_state(path: str) -> Dict:
     if not os.path.exists(path):
-        return {"repost_records": {}, "like_records": {}}
-    with open(path, "r", encoding="utf-8") as f:
-        return json.load(f)
+        state = {"repost_records": {}, "like_records": {}}
+    elif orjson is not None:
+        with open(path, "rb") as f:
+            state = orjson.loads(f.read())
+    else:
+        with open(path, "r", encoding="utf-8") as f:
+            state = json.load(f)
+    replay_journal(journal_path(path), state)
+    return state
 
 
 def save_state(path: str, state: Dict) -> None:
     tmp = path + ".tmp"
-    with open(tmp, "w", encoding="utf-8") as f:
-        json.dump(state, f, ensure_ascii=False, indent=2)
+    if orjson is not None:
+        with open(tmp, "wb") as f:
+            f.write(orjson.dumps(state, option=orjson.OPT_INDENT_2))
+            f.flush()
+            os.fsync(f.fileno())
+    else:
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(state, f, ensure_ascii=False, indent=2)
+            f.flush()
+            os.fsync(f.fileno())
     os.replace(tmp, path)
+    fsync_dir(path)
+    # state.json is nu compleet -> journal is overbodig
+    try:
+        os.remove(journal_path(path))
+    except FileNotFoundError:
+        pass
+
+
+def fsync_dir(path: str) -> None:
+    """
+    Rename pas duurzaam na fsync van de map (POSIX); elders no-op.
+    """
+    try:
+        fd = os.open(os.path.dirname(os.path.abspath(path)), os.O_RDONLY)
+    except OSError:
+        return
+    try:
+        os.fsync(fd)
+    except OSError:
+        pass
+    finally:
+        os.close(fd)
+
+
+JOURNAL_KEYS = frozenset({"repost_records", "like_records"})
+
+
+def journal_path(state_path: str) -> str:
+    return state_path + ".journal"
+
+
+def journal_record(state_path: str, records_key: str, subject_uri: str, record_uri: Optional[str]) -> None:
+    """
+    Append-only journal (NDJSON) naast state.json: elke write wordt direct
+    vastgelegd (fsync), zodat een crash halverwege de run geen records kwijtraakt.
+    record_uri=None -> entry verwijderd.
+    """
+    line = json.dumps({"key": records_key, "post_uri": subject_uri, "uri": record_uri}, ensure_ascii=False)
+    with open(journal_path(state_path), "a", encoding="utf-8") as f:
+        f.write(line + "\n")
+        f.flush()
+        os.fsync(f.fileno())
+
+
+def replay_journal(path: str, state: Dict) -> None:
+    if not os.path.exists(path):
+        return
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            try:
+                entry = json.loads(line)
+            except ValueError:
+                continue  # half geschreven laatste regel
+            if not isinstance(entry, dict):
+                continue
+            key = entry.get("key")
+            post_uri = entry.get("post_uri")
+            if key not in JOURNAL_KEYS or not isinstance(post_uri, str) or not post_uri:
+                continue  # onbekende/kapotte regel: state niet vervuilen
+            records = state.get(key)
+            if not isinstance(records, dict):
+                records = state[key] = {}
+            if entry.get("uri"):
+                records[post_uri] = entry["uri"]
+            else:
+                records.pop(post_uri, None)
+
+
+def _session_fernet(session_key: str) -> Fernet:
+    key = hashlib.sha256(session_key.encode("utf-8")).digest()
+    return Fernet(base64.urlsafe_b64encode(key))
+
+
+def encrypt_session(session_string: str, session_key: str) -> Dict[str, str]:
+    """
+    Session string versleuteld voor state.json (die publiek in de repo staat).
+    Sleutel komt uit een eigen secret (BSKY_SESSION_KEY), nooit uit het wachtwoord:
+    dan is state.json geen offline test voor wachtwoord-gokken.
+    """
+    token = _session_fernet(session_key).encrypt(session_string.encode("utf-8"))
+    return {"token": token.decode("ascii")}
+
+
+def decrypt_session(blob: Optional[Dict], session_key: str) -> Optional[str]:
+    if not blob or not session_key:
+        return None
+    try:
+        return _session_fernet(session_key).decrypt(blob["token"].encode("ascii")).decode("utf-8")
+    except Exception:
+        return None
+
+
+def login(client: Client, state: Dict, username: str, password: str, session_key: str) -> None:
+    """
+    Eerst de opgeslagen session (geen createSession nodig), anders gewoon inloggen.
+    """
+    session_string = decrypt_session(state.get("session"), session_key)
+    if session_string:
+        try:
+            client.login(session_string=session_string)
+            log("🔑 Session hergebruikt")
+            return
+        except Exception as e:
+            log(f"⚠️ Opgeslagen session ongeldig, opnieuw inloggen: {e}")
+    client.login(username, password)
 
 
 def parse_at_uri_rkey(uri: str) -> Optional[Tuple[str, str, str]]:
@@ -215,7 +414,11 @@ def parse_at_uri_rkey(uri: str) -> Optional[Tuple[str, str, str]]:
     return parts[0], parts[1], parts[2]
 
 
-def fetch_feed_items(client: Client, feed_uri: str, max_items: int) -> List:
+def fetch_feed_items(client: Client, feed_uri: str, max_items: int, stop_before: Optional[datetime] = None) -> List:
+    """
+    stop_before: stop met pagineren zodra een volledige pagina ouder is
+    (feeds zijn grofweg nieuw -> oud, volgende pagina's zijn nog ouder).
+    """
     items: List = []
     cursor = None
     while True:
@@ -228,6 +431,10 @@ def fetch_feed_items(client: Client, feed_uri: str, max_items: int) -> List:
         cursor = getattr(out, "cursor", None)
         if not cursor or len(items) >= max_items:
             break
+        if stop_before and batch:
+            times = [parse_time(getattr(it, "post", None)) for it in batch]
+            if all(t is not None and t < stop_before for t in times):
+                break
     return items[:max_items]
 
 
@@ -264,76 +471,134 @@ def fetch_author_feed(client: Client, actor: str, limit: int) -> List:
         return []
 
 
-def fetch_hashtag_posts(client: Client, max_items: int) -> List:
+def fetch_author_feeds(pool: ThreadPoolExecutor, client: Client, actors: List[str], limit: int) -> Iterator[List]:
+    """
+    Author feeds parallel ophalen (I/O-bound) via de gedeelde read-pool, zodat
+    feeds/hashtag en author feeds samen binnen FETCH_CONCURRENCY blijven.
+    Resultaten komen terug in dezelfde volgorde als actors.
+    """
+    if not actors:
+        return
+    yield from pool.map(lambda actor: fetch_author_feed(client, actor, limit), actors)
+
+
+def fetch_hashtag_posts(client: Client, max_items: int, stop_before: Optional[datetime] = None) -> List:
+    """
+    Pagineert search_posts (altijd limit=100, client-side afgekapt op max_items).
+    sort=latest -> stoppen zodra een volledige pagina ouder is dan stop_before.
+    """
+    posts: List = []
+    cursor = None
     try:
-        out = client.app.bsky.feed.search_posts({"q": HASHTAG_QUERY, "sort": "latest", "limit": max_items})
-        return getattr(out, "posts", []) or []
-    except Exception:
-        return []
+        while True:
+            params = {"q": HASHTAG_QUERY, "sort": "latest", "limit": 100}
+            if cursor:
+                params["cursor"] = cursor
+            out = client.app.bsky.feed.search_posts(params)
+            batch = getattr(out, "posts", []) or []
+            posts.extend(batch)
+            cursor = getattr(out, "cursor", None)
+            if not batch or not cursor or len(posts) >= max_items:
+                break
+            if stop_before:
+                times = [parse_time(p) for p in batch]
+                if all(t is not None and t < stop_before for t in times):
+                    break
+    except Exception as e:
+        log(f"⚠️ Hashtag search error: {e}")
+    return posts[:max_items]
 
 
-def build_candidates_from_feed_items(
-    items: List,
+def cutoff_to_iso(cutoff: datetime) -> str:
+    """
+    Cutoff als iso-string, afgerond naar beneden op hele seconden (".000Z"),
+    zodat een string-vergelijking nooit een post weggooit die binnen de cutoff valt.
+    """
+    return cutoff.astimezone(timezone.utc).strftime("%Y-%m-%dT%H:%M:%S.000Z")
+
+
+def candidate_from_post(
+    post,
     cutoff: datetime,
     exclude_handles: Set[str],
     exclude_dids: Set[str],
     force_refresh: bool,
-) -> List[Dict]:
+    cutoff_iso: Optional[str] = None,
+) -> Optional[Dict]:
     """
+    Gedeelde filter voor feed-items en hashtag-posts.
     force_refresh=True (PROMO): cutoff wordt genegeerd.
+    cutoff_iso: zie cutoff_to_iso(); alleen een voorfilter, de exacte check blijft.
     """
-    cands: List[Dict] = []
-    for item in items:
-        post = getattr(item, "post", None)
-        if not post:
-            continue
-
-        # skip boosts/reposts
-        if hasattr(item, "reason") and item.reason is not None:
-            continue
+    # directe attribute-access (atproto models); ontbreekt iets -> skip
+    try:
+        record, uri, cid, ah, ad = POST_FIELDS(post)
+    except AttributeError:
+        return None
+    ah = (ah or "").lower()
+    ad = (ad or "").lower()
 
-        record = getattr(post, "record", None)
-        if not record:
-            continue
+    if not record or not uri or not cid:
+        return None
 
-        if getattr(record, "reply", None):
-            continue
+    # goedkoopste checks eerst
+    if ah in exclude_handles or ad in exclude_dids:
+        return None
 
-        if is_quote_post(record):
-            continue
+    # snelle cutoff-check op de ruwe iso-string (UTC, 'Z'): oude posts zonder datetime-parse weg
+    if cutoff_iso and not force_refresh:
+        indexed = getattr(post, "indexed_at", None)
+        if indexed and indexed[-1:] == "Z" and indexed[10:11] == "T" and indexed < cutoff_iso:
+            return None
 
-        if not has_media(record):
-            continue
+    if getattr(record, "reply", None):
+        return None
 
-        uri = getattr(post, "uri", None)
-        cid = getattr(post, "cid", None)
-        if not uri or not cid:
-            continue
+    if is_quote_post(record):
+        return None
 
-        author = getattr(post, "author", None)
-        ah = (getattr(author, "handle", "") or "").lower()
-        ad = (getattr(author, "did", "") or "").lower()
+    if not has_media(record):
+        return None
 
-        if ah in exclude_handles or ad in exclude_dids:
-            continue
+    created = parse_time(post)
+    if not created:
+        return None
 
-        created = parse_time(post)
-        if not created:
-            continue
+    # ✅ Alleen niet-promo moet binnen cutoff vallen
+    if created < cutoff and not force_refresh:
+        return None
 
-        # ✅ Alleen niet-promo moet binnen cutoff vallen
-        if created < cutoff and not force_refresh:
-            continue
+    return {
+        "uri": uri,
+        "cid": cid,
+        "created": created,
+        "author_key": ad or ah or uri,
+        "force_refresh": force_refresh,
+    }
 
-        cands.append({
-            "uri": uri,
-            "cid": cid,
-            "created": created,
-            "author_key": ad or ah or uri,
-            "force_refresh": force_refresh,
-        })
 
-    cands.sort(key=lambda x: x["created"])
+def build_candidates_from_feed_items(
+    items: List,
+    cutoff: datetime,
+    exclude_handles: Set[str],
+    exclude_dids: Set[str],
+    force_refresh: bool,
+) -> List[Dict]:
+    """
+    force_refresh=True (PROMO): cutoff wordt genegeerd.
+    """
+    cands: List[Dict] = []
+    cutoff_iso = cutoff_to_iso(cutoff)
+    for item in items:
+        # skip boosts/reposts
+        if getattr(item, "reason", None) is not None:
+            continue
+        post = getattr(item, "post", None)
+        if not post:
+            continue
+        c = candidate_from_post(post, cutoff, exclude_handles, exclude_dids, force_refresh, cutoff_iso)
+        if c:
+            cands.append(c)
     return cands
 
 
@@ -347,46 +612,204 @@ def build_candidates_from_postviews(
     Hashtag blijft binnen cutoff.
     """
     cands: List[Dict] = []
+    cutoff_iso = cutoff_to_iso(cutoff)
     for post in posts:
-        record = getattr(post, "record", None)
-        if not record:
-            continue
+        c = candidate_from_post(post, cutoff, exclude_handles, exclude_dids, force_refresh=False, cutoff_iso=cutoff_iso)
+        if c:
+            cands.append(c)
+    return cands
 
-        if getattr(record, "reply", None):
-            continue
 
-        if is_quote_post(record):
-            continue
+# ============================================================
+# RATE LIMITING (ratelimit-headers van de PDS)
+# ============================================================
+REPO_WRITE_NSIDS = frozenset({
+    "com.atproto.repo.applyWrites",
+    "com.atproto.repo.createRecord",
+    "com.atproto.repo.deleteRecord",
+})
+WRITE_POINTS = {"create": 3, "update": 2, "delete": 1}  # PDS rekent repo-writes in punten, per op
 
-        if not has_media(record):
-            continue
 
-        uri = getattr(post, "uri", None)
-        cid = getattr(post, "cid", None)
-        if not uri or not cid:
-            continue
+def write_cost(nsid: str, data) -> int:
+    """
+    Punten die een repo-write kost (ratelimit-remaining telt in punten):
+    bij applyWrites opgeteld over alle ops.
+    """
+    if nsid == "com.atproto.repo.applyWrites":
+        writes = getattr(data, "writes", None) or []
+        return sum(WRITE_POINTS.get(str(getattr(w, "py_type", "")).rsplit("#", 1)[-1], 3) for w in writes) or 1
+    if nsid == "com.atproto.repo.deleteRecord":
+        return WRITE_POINTS["delete"]
+    return WRITE_POINTS["create"]
 
-        author = getattr(post, "author", None)
-        ah = (getattr(author, "handle", "") or "").lower()
-        ad = (getattr(author, "did", "") or "").lower()
 
-        if ah in exclude_handles or ad in exclude_dids:
-            continue
+class WriteBudgetExhausted(Exception):
+    """
+    Volgende write-slot ligt verder weg dan MAX_WAIT_SECONDS:
+    stoppen met schrijven en state bewaren i.p.v. de job te laten verlopen.
+    """
+
+
+class RateLimitedClient(Client):
+    """
+    Client die na elke repo-write de ratelimit-headers van de PDS bijhoudt,
+    zodat we alleen wachten als het budget daarom vraagt. Het budget is in
+    punten (WRITE_POINTS), dus elke call wordt afgewogen tegen zijn eigen kosten.
+    Alleen REPO_WRITE_NSIDS tellen mee: auth-calls (createSession,
+    refreshSession) hebben een eigen budget.
+    Alle repo-writes (applyWrites, createRecord, deleteRecord) delen één
+    pacing-slot, i.p.v. een losse sleep per call.
+    Bij HTTP 429: Retry-After of ratelimit-reset van de server volgen, anders
+    exponentiële back-off (RETRY_BACKOFF_SECONDS) met jitter; langer dan
+    MAX_WAIT_SECONDS -> direct opnieuw raisen.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.budget: Optional[Tuple[int, float, int]] = None  # (remaining, reset, limit) uit de headers
+        self.last_write_ts = 0.0
+
+    def _invoke(self, invoke_type, **kwargs):
+        nsid = str(kwargs.get("url", "")).rsplit("/", 1)[-1]
+        is_repo_write = nsid in REPO_WRITE_NSIDS
+        cost = write_cost(nsid, kwargs.get("data")) if is_repo_write else 0
+        for delay in RETRY_BACKOFF_SECONDS + [None]:
+            if is_repo_write:
+                self.wait_for_write_slot(cost)
+            try:
+                resp = super()._invoke(invoke_type, **kwargs)
+            except RequestException as e:
+                response = getattr(e, "response", None)
+                if delay is None or response is None or response.status_code != 429:
+                    raise
+                delay = self._retry_delay(response.headers or {}, delay)
+                if delay > MAX_WAIT_SECONDS:
+                    if is_repo_write:
+                        # volgende write stopt direct (WriteBudgetExhausted)
+                        self.budget = (0, time.time() + delay, 0)
+                    log(f"⏹️ Rate limited (429), reset over {delay:.0f}s: niet wachten")
+                    raise
+                log(f"⏳ Rate limited (429), retry in {delay:.1f}s")
+                time.sleep(delay)
+                continue
+            if is_repo_write:
+                self._track_write_budget(getattr(resp, "headers", None) or {})
+            return resp
+
+    @staticmethod
+    def _retry_delay(headers: Dict, backoff: float) -> float:
+        # Retry-After als die er is, anders ratelimit-reset (zo meldt de Bluesky PDS een 429)
+        try:
+            return max(0.0, float(headers["retry-after"]))
+        except (KeyError, TypeError, ValueError):
+            pass
+        try:
+            return max(0.0, float(headers["ratelimit-reset"]) - time.time())
+        except (KeyError, TypeError, ValueError):
+            pass
+        # jitter: niet alle retries op hetzelfde moment
+        return backoff + random.uniform(0, backoff)
+
+    def _track_write_budget(self, headers: Dict) -> None:
+        self.last_write_ts = time.time()
+        try:
+            remaining = int(headers["ratelimit-remaining"])
+            reset = float(headers["ratelimit-reset"])
+        except (KeyError, TypeError, ValueError):
+            self.budget = None
+            return
 
-        created = parse_time(post)
-        if not created or created < cutoff:
+        try:
+            limit = int(headers.get("ratelimit-limit"))
+        except (TypeError, ValueError):
+            limit = 0
+        self.budget = (remaining, reset, limit)
+
+    def write_delay(self, cost: int) -> float:
+        now = time.time()
+        if self.budget is None:
+            # geen headers: vaste spacing
+            return self.last_write_ts + SLEEP_SECONDS - now
+
+        remaining, reset, limit = self.budget
+        if reset <= now:
+            return 0.0  # nieuw venster
+        if remaining < cost:
+            return reset - now
+        if limit and remaining - cost >= limit * RATE_LIMIT_THRESHOLD:
+            # budget ruim genoeg: niet wachten
+            return 0.0
+        # budget krap: resterend budget naar kosten verdelen over de tijd tot de reset
+        return self.last_write_ts + (reset - self.last_write_ts) * cost / remaining - now
+
+    def wait_for_write_slot(self, cost: int) -> None:
+        delay = self.write_delay(cost)
+        if delay > MAX_WAIT_SECONDS:
+            raise WriteBudgetExhausted(f"write budget op ({cost} punten nodig), volgende slot over {delay:.0f}s")
+        if delay > 0:
+            time.sleep(delay)
+
+
+def delete_records(client: Client, me: str, deletes: List[Tuple[str, str]]) -> List[Tuple[str, str]]:
+    """
+    deletes: [(collection, rkey)] -> applyWrites-calls van max APPLY_WRITES_MAX_OPS.
+    Faalt een chunk (bv. record bestaat al niet meer), dan alleen die chunk per record opnieuw.
+    Geeft de deletes terug die gelukt zijn.
+    """
+    done: List[Tuple[str, str]] = []
+    for i in range(0, len(deletes), APPLY_WRITES_MAX_OPS):
+        chunk = deletes[i:i + APPLY_WRITES_MAX_OPS]
+        try:
+            client.com.atproto.repo.apply_writes(
+                models.ComAtprotoRepoApplyWrites.Data(
+                    repo=me,
+                    writes=[
+                        models.ComAtprotoRepoApplyWrites.Delete(collection=collection, rkey=rkey)
+                        for collection, rkey in chunk
+                    ],
+                )
+            )
+            done.extend(chunk)
             continue
+        except WriteBudgetExhausted:
+            raise
+        except Exception as e:
+            log(f"⚠️ Batch delete failed, fallback per record: {e}")
 
-        cands.append({
-            "uri": uri,
-            "cid": cid,
-            "created": created,
-            "author_key": ad or ah or uri,
-            "force_refresh": False,
-        })
+        for collection, rkey in chunk:
+            try:
+                client.com.atproto.repo.delete_record({"repo": me, "collection": collection, "rkey": rkey})
+                done.append((collection, rkey))
+            except WriteBudgetExhausted:
+                raise
+            except Exception as e:
+                log(f"⚠️ PROMO delete failed ({collection}): {e}")
+    return done
 
-    cands.sort(key=lambda x: x["created"])
-    return cands
+
+def own_records(
+    me: str,
+    subject_uri: str,
+    repost_records: Dict[str, str],
+    like_records: Dict[str, str],
+) -> List[Tuple[Dict[str, str], str, Optional[Tuple[str, str]]]]:
+    """
+    Bestaande repost/like van subject_uri -> [(records, records_key, (collection, rkey) of None)].
+    None = niet van ons / onleesbaar: kan niet weg, alleen uit state.
+    """
+    out = []
+    for records, records_key, collection in (
+        (repost_records, "repost_records", "app.bsky.feed.repost"),
+        (like_records, "like_records", "app.bsky.feed.like"),
+    ):
+        existing_uri = records.get(subject_uri)
+        if not existing_uri:
+            continue
+        parsed = parse_at_uri_rkey(existing_uri)
+        own = parsed and parsed[0] == me and parsed[1] == collection
+        out.append((records, records_key, (collection, parsed[2]) if own else None))
+    return out
 
 
 def force_unrepost_unlike_if_needed(
@@ -395,81 +818,145 @@ def force_unrepost_unlike_if_needed(
     subject_uri: str,
     repost_records: Dict[str, str],
     like_records: Dict[str, str],
-):
-    # unrepost
-    if subject_uri in repost_records:
-        existing_repost_uri = repost_records.get(subject_uri)
-        parsed = parse_at_uri_rkey(existing_repost_uri) if existing_repost_uri else None
-        if parsed:
-            did, collection, rkey = parsed
-            if did == me and collection == "app.bsky.feed.repost":
-                try:
-                    client.app.bsky.feed.repost.delete({"repo": me, "rkey": rkey})
-                except Exception as e:
-                    log(f"⚠️ PROMO unrepost failed: {e}")
-        repost_records.pop(subject_uri, None)
-
-    # unlike
-    if subject_uri in like_records:
-        existing_like_uri = like_records.get(subject_uri)
-        parsed = parse_at_uri_rkey(existing_like_uri) if existing_like_uri else None
-        if parsed:
-            did, collection, rkey = parsed
-            if did == me and collection == "app.bsky.feed.like":
-                try:
-                    client.app.bsky.feed.like.delete({"repo": me, "rkey": rkey})
-                except Exception as e:
-                    log(f"⚠️ PROMO unlike failed: {e}")
-        like_records.pop(subject_uri, None)
-
-
-def repost_and_like(
+    state_path: str,
+) -> bool:
+    """
+    unrepost + unlike in één call; een record gaat pas uit state (en journal)
+    als de delete gelukt is, anders zouden we het record kwijtraken.
+    Geeft True als er niets meer van ons op de post staat.
+    """
+    existing = own_records(me, subject_uri, repost_records, like_records)
+    done = set(delete_records(client, me, [d for _, _, d in existing if d]))
+    ok = True
+    for records, records_key, d in existing:
+        if d is None or d in done:
+            records.pop(subject_uri, None)
+            journal_record(state_path, records_key, subject_uri, None)
+        else:
+            ok = False
+    return ok
+
+
+LAST_CREATED_AT: Optional[datetime] = None
+
+
+def created_at_stamps(n: int) -> List[str]:
+    """
+    n oplopende createdAt-waarden (ms-precisie, 1 ms uit elkaar), altijd na die
+    van de vorige aanroep: de schrijfvolgorde (normaal -> promo, oudste eerst)
+    blijft zichtbaar in de records, ook als writes direct achter elkaar gaan.
+    """
+    global LAST_CREATED_AT
+    base = utcnow()
+    base -= timedelta(microseconds=base.microsecond % 1000)
+    if LAST_CREATED_AT is not None and base <= LAST_CREATED_AT:
+        base = LAST_CREATED_AT + timedelta(milliseconds=1)
+    out = []
+    for i in range(n):
+        dt = base + timedelta(milliseconds=i)
+        out.append(dt.strftime("%Y-%m-%dT%H:%M:%S.") + f"{dt.microsecond // 1000:03d}Z")
+        LAST_CREATED_AT = dt
+    return out
+
+
+def create_reposts_and_likes(
     client: Client,
     me: str,
-    subject_uri: str,
-    subject_cid: str,
+    subjects: List[Tuple[str, str]],
     repost_records: Dict[str, str],
     like_records: Dict[str, str],
-    force_refresh: bool,
-) -> bool:
-    if force_refresh:
-        force_unrepost_unlike_if_needed(client, me, subject_uri, repost_records, like_records)
-    else:
-        if subject_uri in repost_records:
-            return False
+    state_path: str,
+    refresh: bool = False,
+) -> List[str]:
+    """
+    subjects: [(uri, cid)] -> repost + like per post, samen in één applyWrites-call.
+    refresh=True (PROMO): onze oude repost/like van de post gaan in dezelfde call
+    weg, dus oud en nieuw wisselen atomair (lukt alles of niets).
+    Geeft de subject-uri's terug die gelukt zijn.
+    Alleen bij een afgewezen batch (HTTP 400) per post opnieuw; bij 429/timeout
+    niet, want dan zou het budget verder opraken of de batch al geschreven zijn.
+    """
+    if not subjects:
+        return []
 
-    # repost
-    try:
-        out = client.app.bsky.feed.repost.create(
-            repo=me,
-            record={
-                "subject": {"uri": subject_uri, "cid": subject_cid},
-                "createdAt": utcnow().strftime("%Y-%m-%dT%H:%M:%SZ"),
-            },
-        )
-        repost_uri = getattr(out, "uri", None)
-        if repost_uri:
-            repost_records[subject_uri] = repost_uri
-    except Exception as e:
-        log(f"⚠️ Repost error: {e}")
-        return False
+    writes = []
+    create_idx: List[int] = []  # index van de repost-write per post (like = +1)
+    for (subject_uri, subject_cid), ts in zip(subjects, created_at_stamps(len(subjects))):
+        if refresh:
+            for _, _, d in own_records(me, subject_uri, repost_records, like_records):
+                if d:
+                    writes.append(models.ComAtprotoRepoApplyWrites.Delete(collection=d[0], rkey=d[1]))
+        subject = {"uri": subject_uri, "cid": subject_cid}
+        create_idx.append(len(writes))
+        writes.append(models.ComAtprotoRepoApplyWrites.Create(
+            collection="app.bsky.feed.repost",
+            value={"$type": "app.bsky.feed.repost", "subject": subject, "createdAt": ts},
+        ))
+        writes.append(models.ComAtprotoRepoApplyWrites.Create(
+            collection="app.bsky.feed.like",
+            value={"$type": "app.bsky.feed.like", "subject": subject, "createdAt": ts},
+        ))
 
-    # like
     try:
-        out_like = client.app.bsky.feed.like.create(
-            repo=me,
-            record={
-                "subject": {"uri": subject_uri, "cid": subject_cid},
-                "createdAt": utcnow().strftime("%Y-%m-%dT%H:%M:%SZ"),
-            },
+        out = client.com.atproto.repo.apply_writes(
+            models.ComAtprotoRepoApplyWrites.Data(repo=me, writes=writes)
         )
-        like_uri = getattr(out_like, "uri", None)
-        if like_uri:
-            like_records[subject_uri] = like_uri
+    except WriteBudgetExhausted:
+        raise
+    except BadRequestError as e:
+        if len(subjects) > 1:
+            # batch afgewezen -> per post opnieuw, zodat één slechte post de rest niet blokkeert
+            log(f"⚠️ Batch rejected, fallback per post: {e}")
+            done: List[str] = []
+            for subject in subjects:
+                done.extend(create_reposts_and_likes(
+                    client, me, [subject], repost_records, like_records, state_path, refresh
+                ))
+            return done
+        if refresh and len(writes) > 2:
+            # bv. oude repost al handmatig weg -> los verwijderen, daarna gewoon aanmaken
+            log(f"⚠️ PROMO refresh rejected, fallback delete + create: {e}")
+            if force_unrepost_unlike_if_needed(client, me, subjects[0][0], repost_records, like_records, state_path):
+                return create_reposts_and_likes(client, me, subjects, repost_records, like_records, state_path)
+            return []
+        log(f"⚠️ Repost+like error: {e}")
+        return []
     except Exception as e:
-        log(f"⚠️ Like error: {e}")
+        log(f"⚠️ Repost+like error: {e}")
+        return []
 
-    return True
+    # results staan in dezelfde volgorde als writes: [deletes..., repost, like] per post
+    results = getattr(out, "results", None) or []
+    done: List[str] = []
+    for (subject_uri, _), idx in zip(subjects, create_idx):
+        for offset, records, records_key in ((0, repost_records, "repost_records"), (1, like_records, "like_records")):
+            uri = getattr(results[idx + offset], "uri", None) if len(results) > idx + offset else None
+            if uri:
+                records[subject_uri] = uri
+                journal_record(state_path, records_key, subject_uri, uri)
+            elif refresh and records.pop(subject_uri, None):
+                # oude is in deze call verwijderd
+                journal_record(state_path, records_key, subject_uri, None)
+        done.append(subject_uri)
+    return done
+
+
+def normalize_links(client: Client, config: Dict[str, Dict[str, str]], normalize, label: str) -> List[Tuple[str, str, str]]:
+    """
+    CONFIG-blok (FEEDS / LIJSTEN / EXCLUDE_LISTS) -> [(key, note, at-uri)]; lege links worden overgeslagen.
+    """
+    out: List[Tuple[str, str, str]] = []
+    for key, obj in config.items():
+        link = (obj.get("link") or "").strip()
+        note = (obj.get("note") or "").strip()
+        if not link:
+            continue
+        uri = normalize(client, link)
+        if uri:
+            out.append((key, note, uri))
+        else:
+            log(f"⚠️ {label} ongeldig (skip): {key} -> {link}")
+    return out
 
 
 def main():
@@ -477,6 +964,7 @@ def main():
 
     username = os.getenv(ENV_USERNAME, "").strip()
     password = os.getenv(ENV_PASSWORD, "").strip()
+    session_key = os.getenv(ENV_SESSION_KEY, "").strip()
     if not username or not password:
         log(f"❌ Missing env {ENV_USERNAME} / {ENV_PASSWORD}")
         return
@@ -486,57 +974,32 @@ def main():
     state = load_state(STATE_FILE)
     repost_records: Dict[str, str] = state.get("repost_records", {})
     like_records: Dict[str, str] = state.get("like_records", {})
+    DID_CACHE.update(state.get("did_cache", {}))
 
-    client = Client()
-    client.login(username, password)
+    client = RateLimitedClient()
+    login(client, state, username, password, session_key)
     me = client.me.did
     log(f"✅ Logged in as {me}")
 
-    # normalize feeds
-    feed_uris: List[Tuple[str, str, str]] = []
-    for key, obj in FEEDS.items():
-        link = (obj.get("link") or "").strip()
-        note = (obj.get("note") or "").strip()
-        if not link:
-            continue
-        uri = normalize_feed_uri(client, link)
-        if uri:
-            feed_uris.append((key, note, uri))
-        else:
-            log(f"⚠️ Feed ongeldig (skip): {key} -> {link}")
+    feed_uris = normalize_links(client, FEEDS, normalize_feed_uri, "Feed")
+    list_uris = normalize_links(client, LIJSTEN, normalize_list_uri, "Lijst")
+    excl_uris = normalize_links(client, EXCLUDE_LISTS, normalize_list_uri, "Exclude lijst")
 
-    # normalize lists
-    list_uris: List[Tuple[str, str, str]] = []
-    for key, obj in LIJSTEN.items():
-        link = (obj.get("link") or "").strip()
-        note = (obj.get("note") or "").strip()
-        if not link:
-            continue
-        uri = normalize_list_uri(client, link)
-        if uri:
-            list_uris.append((key, note, uri))
-        else:
-            log(f"⚠️ Lijst ongeldig (skip): {key} -> {link}")
-
-    # normalize exclude
-    excl_uris: List[Tuple[str, str, str]] = []
-    for key, obj in EXCLUDE_LISTS.items():
-        link = (obj.get("link") or "").strip()
-        note = (obj.get("note") or "").strip()
-        if not link:
-            continue
-        uri = normalize_list_uri(client, link)
-        if uri:
-            excl_uris.append((key, note, uri))
-        else:
-            log(f"⚠️ Exclude lijst ongeldig (skip): {key} -> {link}")
-
-    # build exclude sets
+    # build exclude sets (leden per lijst gecachet in state, EXCLUDE_CACHE_HOURS)
     exclude_handles: Set[str] = set()
     exclude_dids: Set[str] = set()
+    old_exclude_cache: Dict[str, Dict] = state.get("exclude_list_cache", {})
+    exclude_cache: Dict[str, Dict] = {}
     for key, note, luri in excl_uris:
-        log(f"🚫 Loading exclude list: {key} ({note})")
-        members = fetch_list_members(client, luri, limit=max(1000, LIST_MEMBER_LIMIT))
+        cached = old_exclude_cache.get(luri)
+        if cached and is_fresh(cached.get("ts"), EXCLUDE_CACHE_HOURS):
+            log(f"🚫 Exclude list (cache): {key} ({note})")
+            members = [(h, d) for h, d in cached.get("members", [])]
+        else:
+            log(f"🚫 Loading exclude list: {key} ({note})")
+            members = fetch_list_members(client, luri, limit=max(1000, LIST_MEMBER_LIMIT))
+            cached = {"members": [[h, d] for h, d in members], "ts": utcnow().strftime("%Y-%m-%dT%H:%M:%SZ")}
+        exclude_cache[luri] = cached
         log(f"🚫 Exclude members: {len(members)}")
         for h, d in members:
             if h:
@@ -551,48 +1014,53 @@ def main():
     feed_uris.sort(key=lambda x: promo_sort(x, PROMO_FEED_KEY))
     list_uris.sort(key=lambda x: promo_sort(x, PROMO_LIST_KEY))
 
-    all_candidates: List[Dict] = []
-
-    # feeds
-    log(f"Feeds to process: {len(feed_uris)}")
-    for key, note, furi in feed_uris:
-        is_promo = (key == PROMO_FEED_KEY)
-        log(f"📥 Feed: {key} ({note})" + (" [PROMO]" if is_promo else ""))
-        items = fetch_feed_items(client, furi, max_items=FEED_MAX_ITEMS)
-        all_candidates.extend(
-            build_candidates_from_feed_items(items, cutoff, exclude_handles, exclude_dids, force_refresh=is_promo)
-        )
-
-    # lists
-    log(f"Lists to process: {len(list_uris)}")
-    for key, note, luri in list_uris:
-        is_promo = (key == PROMO_LIST_KEY)
-        log(f"📋 List: {key} ({note})" + (" [PROMO]" if is_promo else ""))
-        members = fetch_list_members(client, luri, limit=max(1000, LIST_MEMBER_LIMIT))
-        log(f"👥 Members fetched: {len(members)}")
-
-        for (h, d) in members:
-            actor = d or h
-            if not actor:
-                continue
-
-            author_items = fetch_author_feed(client, actor, AUTHOR_POSTS_PER_MEMBER)
-            cands = build_candidates_from_feed_items(
-                author_items, cutoff, exclude_handles, exclude_dids, force_refresh=is_promo
+    # feeds + hashtag lopen op de achtergrond terwijl de lijsten verwerkt worden;
+    # één pool voor alle reads: max FETCH_CONCURRENCY tegelijk (+ de hoofdthread voor lijstleden)
+    with ThreadPoolExecutor(max_workers=max(1, FETCH_CONCURRENCY)) as pool:
+        log(f"Feeds to process: {len(feed_uris)}")
+        feed_jobs = []
+        for key, note, furi in feed_uris:
+            is_promo = (key == PROMO_FEED_KEY)
+            log(f"📥 Feed: {key} ({note})" + (" [PROMO]" if is_promo else ""))
+            fut = pool.submit(fetch_feed_items, client, furi, FEED_MAX_ITEMS, None if is_promo else cutoff)
+            feed_jobs.append((is_promo, fut))
+
+        log(f"🔎 Hashtag search: {HASHTAG_QUERY}")
+        hashtag_job = pool.submit(fetch_hashtag_posts, client, HASHTAG_MAX_ITEMS, cutoff)
+
+        # lists
+        list_candidates: List[Dict] = []
+        log(f"Lists to process: {len(list_uris)}")
+        for key, note, luri in list_uris:
+            is_promo = (key == PROMO_LIST_KEY)
+            log(f"📋 List: {key} ({note})" + (" [PROMO]" if is_promo else ""))
+            members = fetch_list_members(client, luri, limit=max(1000, LIST_MEMBER_LIMIT))
+            log(f"👥 Members fetched: {len(members)}")
+
+            actors = [d or h for (h, d) in members if d or h]
+            for author_items in fetch_author_feeds(pool, client, actors, AUTHOR_POSTS_PER_MEMBER):
+                cands = build_candidates_from_feed_items(
+                    author_items, cutoff, exclude_handles, exclude_dids, force_refresh=is_promo
+                )
+
+                if is_promo:
+                    # ✅ PROMO: per member alleen de nieuwste mediapost (cutoff genegeerd door builder)
+                    if cands:
+                        list_candidates.append(max(cands, key=lambda x: x["created"]))
+                else:
+                    list_candidates.extend(cands)
+
+        # volgorde feeds -> lijsten -> hashtag blijft gelijk (dedupe houdt de eerste)
+        all_candidates: List[Dict] = []
+        for is_promo, fut in feed_jobs:
+            all_candidates.extend(
+                build_candidates_from_feed_items(fut.result(), cutoff, exclude_handles, exclude_dids, force_refresh=is_promo)
             )
+        all_candidates.extend(list_candidates)
 
-            if is_promo:
-                # ✅ PROMO: per member alleen de nieuwste mediapost (cutoff genegeerd door builder)
-                if cands:
-                    all_candidates.append(cands[-1])
-            else:
-                all_candidates.extend(cands)
-
-    # hashtag
-    log(f"🔎 Hashtag search: {HASHTAG_QUERY}")
-    hashtag_posts = fetch_hashtag_posts(client, HASHTAG_MAX_ITEMS)
-    log(f"Hashtag posts fetched: {len(hashtag_posts)}")
-    all_candidates.extend(build_candidates_from_postviews(hashtag_posts, cutoff, exclude_handles, exclude_dids))
+        hashtag_posts = hashtag_job.result()
+        log(f"Hashtag posts fetched: {len(hashtag_posts)}")
+        all_candidates.extend(build_candidates_from_postviews(hashtag_posts, cutoff, exclude_handles, exclude_dids))
 
     # ============================================================
     # DEDUPE + VERWERKING: PROMO ALS LAATSTE (zodat het bovenaan staat)
@@ -612,7 +1080,6 @@ def main():
     promo_cands = [c for c in deduped if c.get("force_refresh")]
     normal_cands = [c for c in deduped if not c.get("force_refresh")]
 
-    normal_cands.sort(key=lambda x: x["created"])
     promo_cands.sort(key=lambda x: x["created"])
 
     log(f"🧩 Candidates total (deduped): {len(deduped)} | normal: {len(normal_cands)} | promo: {len(promo_cands)}")
@@ -624,37 +1091,54 @@ def main():
     reserve_for_promo = len(promo_cands)
     normal_budget = max(0, MAX_PER_RUN - reserve_for_promo)
 
-    # 1) normaal eerst
-    for c in normal_cands:
-        if total_done >= normal_budget:
-            break
+    # 1) normaal eerst: selecteren, daarna in batches van WRITE_BATCH_SIZE schrijven
+    # oudste eerst via een heap: alleen poppen wat we echt gebruiken (geen volledige sort)
+    normal_heap = [(c["created"], i, c) for i, c in enumerate(normal_cands)]
+    heapq.heapify(normal_heap)
+    selected: List[Dict] = []
+    while normal_heap and len(selected) < normal_budget:
+        _, _, c = heapq.heappop(normal_heap)
 
-        ak = c["author_key"]
-        per_user_count.setdefault(ak, 0)
+        if c["uri"] in repost_records:
+            continue
 
-        if per_user_count[ak] >= MAX_PER_USER:
+        ak = c["author_key"]
+        cnt = per_user_count.get(ak, 0)
+        if cnt >= MAX_PER_USER:
             continue
 
-        ok = repost_and_like(client, me, c["uri"], c["cid"], repost_records, like_records, force_refresh=False)
-        if ok:
-            total_done += 1
-            per_user_count[ak] += 1
-            log(f"✅ Repost+Like: {c['uri']}")
-            time.sleep(SLEEP_SECONDS)
+        per_user_count[ak] = cnt + 1
+        selected.append(c)
 
-        # 2) PROMO ALS LAATSTE (feed + lijst) → blijft bovenaan
-    for c in promo_cands:
-        if total_done >= MAX_PER_RUN:
-            break
+    try:
+        for i in range(0, len(selected), WRITE_BATCH_SIZE):
+            batch = [(c["uri"], c["cid"]) for c in selected[i:i + WRITE_BATCH_SIZE]]
+            for uri in create_reposts_and_likes(client, me, batch, repost_records, like_records, STATE_FILE):
+                total_done += 1
+                log(f"✅ Repost+Like: {uri}")
 
-        ok = repost_and_like(client, me, c["uri"], c["cid"], repost_records, like_records, force_refresh=True)
-        if ok:
-            total_done += 1
-            log(f"✅ PROMO refresh repost+like: {c['uri']}")
-            time.sleep(SLEEP_SECONDS)
+        # 2) PROMO ALS LAATSTE (feed + lijst) → blijft bovenaan
+        # per post oud weg + nieuw erin in één call: stopt de run halverwege, dan blijft de rest gewoon staan
+        for c in promo_cands[:max(0, MAX_PER_RUN - total_done)]:
+            subject = [(c["uri"], c["cid"])]
+            if create_reposts_and_likes(client, me, subject, repost_records, like_records, STATE_FILE, refresh=True):
+                total_done += 1
+                log(f"✅ PROMO refresh repost+like: {c['uri']}")
+    except WriteBudgetExhausted as e:
+        # liever nu stoppen en bewaren dan de job laten verlopen (journal staat op een tijdelijke runner)
+        log(f"⏹️ Gestopt met schrijven: {e}")
 
     state["repost_records"] = repost_records
     state["like_records"] = like_records
+    state["did_cache"] = DID_CACHE
+    state["exclude_list_cache"] = exclude_cache
+    # zonder eigen sleutel geen session in de (publieke) state; ook een oude niet laten staan
+    state.pop("session", None)
+    if session_key:
+        try:
+            state["session"] = encrypt_session(client.export_session_string(), session_key)
+        except Exception as e:
+            log(f"⚠️ Session niet bewaard: {e}")
     save_state(STATE_FILE, state)
     log(f"🔥 Done — total reposts this run: {total_done}")
 